@@ -1,12 +1,60 @@
 """Memory system for persistent agent memory."""
 
+import atexit
+import io
+import mmap
+import os
+import re
+import threading
+import time
+import weakref
 from pathlib import Path
-from datetime import datetime
+from datetime import date
 
 from loguru import logger
 
+from nanobot.agent.vectorstore import PARAGRAPH_RE
 from nanobot.utils.helpers import ensure_dir, today_date
 
+# Daily note filenames: YYYY-MM-DD.md
+_DAILY_FILE_RE = re.compile(r"\d{4}-\d{2}-\d{2}\.md")
+# Files larger than this are decoded straight from a memory map
+_MMAP_THRESHOLD = 64 * 1024
+
+
+def _read(path: Path) -> str:
+    """Read a UTF-8 file with a single decode, bypassing the text I/O layer."""
+    return path.read_bytes().decode("utf-8")
+
+
+def _read_or_empty(path: Path) -> str:
+    """Like _read, but a missing file reads as "" (one open instead of exists() + open)."""
+    try:
+        return _read(path)
+    except FileNotFoundError:
+        return ""
+
+
+def _date_window(days: int) -> tuple[str, str]:
+    """Return (oldest, newest) YYYY-MM-DD bounds of the last N days, today included."""
+    today = date.today().toordinal()
+    return date.fromordinal(today - days + 1).isoformat(), date.fromordinal(today).isoformat()
+
+
+# Stores whose pending daily appends get indexed at interpreter exit
+_exit_stores: "weakref.WeakSet[MemoryStore]" = weakref.WeakSet()
+
+
+def _flush_stores_at_exit() -> None:
+    for store in list(_exit_stores):
+        store.flush_today()
+
+
+def _read_mapped(path: Path) -> str:
+    """Decode a (non-empty) UTF-8 file directly out of a read-only memory map."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return str(mm, "utf-8")
+
 
 class MemoryStore:
     """
@@ -16,11 +64,28 @@ class MemoryStore:
     Optionally backed by ChromaDB for semantic search (RAG).
     """
 
+    KEYWORD_SEARCH_DAYS = 30
+    TODAY_FLUSH_INTERVAL = 30.0  # seconds an append may stay unindexed
+    # Newest daily files re-checked on startup, for appends a killed process left pending
+    STARTUP_REFRESH_FILES = 2
+
     def __init__(self, workspace: Path, chroma_dir: Path | None = None):
         self.workspace = workspace
         self.memory_dir = ensure_dir(workspace / "memory")
         self.memory_file = self.memory_dir / "MEMORY.md"
         self._vector = None
+        # (memory_dir mtime_ns, daily files newest first)
+        self._listing_cache: tuple[int, list[Path]] | None = None
+        # file -> (mtime_ns, size) at its last successful vector-store upsert
+        self._last_indexed: dict[Path, tuple[int, int]] = {}
+        # file -> ((mtime_ns, size), content) for read_long_term and the current read_today
+        self._read_cache: dict[Path, tuple[tuple[int, int], str]] = {}
+        # Daily file with appends not yet in the vector store, and since when
+        self._today_dirty: Path | None = None
+        self._today_dirty_since: float | None = None
+        # Guards the pending-append state and index refreshes, which also run
+        # on memory_search's worker thread
+        self._index_lock = threading.RLock()
 
         # Initialize vector store if chromadb available
         if chroma_dir is not None:
@@ -29,8 +94,16 @@ class MemoryStore:
                 try:
                     from nanobot.agent.vectorstore import VectorStore
                     self._vector = VectorStore(chroma_dir)
-                    if self._vector.count() == 0:
+                    if self._vector.count() == 0 or self._vector.needs_reindex:
                         self._reindex_all()
+                    else:
+                        for file_path in self.list_memory_files()[: self.STARTUP_REFRESH_FILES]:
+                            self._refresh_index(file_path)
+                    # One weakly-held hook for all stores; re-registering keeps it
+                    # last, so it runs before the vector store's exit hook.
+                    _exit_stores.add(self)
+                    atexit.unregister(_flush_stores_at_exit)
+                    atexit.register(_flush_stores_at_exit)
                 except Exception as e:
                     logger.warning(f"Failed to initialize VectorStore: {e}")
                     self._vector = None
@@ -43,36 +116,43 @@ class MemoryStore:
 
     def read_today(self) -> str:
         """Read today's memory notes."""
-        today_file = self.get_today_file()
-        if today_file.exists():
-            return today_file.read_text(encoding="utf-8")
-        return ""
+        return self._read_cached(self.get_today_file())
 
     def append_today(self, content: str) -> None:
         """Append content to today's memory notes."""
         today_file = self.get_today_file()
 
-        if today_file.exists():
-            existing = today_file.read_text(encoding="utf-8")
-            content = existing + "\n" + content
-        else:
-            # Add header for new day
-            header = f"# {today_date()}\n\n"
-            content = header + content
-
-        today_file.write_text(content, encoding="utf-8")
+        # Exclusive create tells a new day from an existing file without a
+        # separate exists() probe; only the delta is ever written.
+        try:
+            with open(today_file, "xb") as f:
+                # Add header for new day
+                f.write(f"# {today_date()}\n\n{content}".encode("utf-8"))
+            self._listing_cache = None
+        except FileExistsError:
+            with open(today_file, "ab") as f:
+                # Blank-line separator keeps the new text in its own paragraph(s)
+                f.write(f"\n\n{content}".encode("utf-8"))
 
         if self._vector:
-            try:
-                self._vector.upsert_file(today_file, doc_type="daily")
-            except Exception as e:
-                logger.warning(f"Failed to upsert today's notes to vector store: {e}")
+            with self._index_lock:
+                if self._today_dirty != today_file:
+                    self.flush_today()
+                    self._today_dirty = today_file
+                    self._today_dirty_since = time.monotonic()
+                elif time.monotonic() - self._today_dirty_since >= self.TODAY_FLUSH_INTERVAL:
+                    self.flush_today()
+
+    def flush_today(self) -> None:
+        """Index any pending appends to the daily notes into the vector store."""
+        with self._index_lock:
+            dirty, self._today_dirty, self._today_dirty_since = self._today_dirty, None, None
+            if dirty is not None and self._vector:
+                self._refresh_index(dirty)
 
     def read_long_term(self) -> str:
         """Read long-term memory (MEMORY.md)."""
-        if self.memory_file.exists():
-            return self.memory_file.read_text(encoding="utf-8")
-        return ""
+        return self._read_cached(self.memory_file)
 
     def write_long_term(self, content: str) -> None:
         """Write to long-term memory (MEMORY.md)."""
@@ -84,6 +164,27 @@ class MemoryStore:
             except Exception as e:
                 logger.warning(f"Failed to upsert MEMORY.md to vector store: {e}")
 
+    def _read_cached(self, path: Path) -> str:
+        """Read a memory file, reusing the last decode while its mtime and size are unchanged."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._read_cache.pop(path, None)
+            return ""
+
+        key = (st.st_mtime_ns, st.st_size)
+        cached = self._read_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        content = _read_mapped(path) if st.st_size > _MMAP_THRESHOLD else _read(path)
+        if path != self.memory_file:
+            # Keep one daily file only, so earlier days drop out on rollover
+            for stale in [p for p in self._read_cache if p not in (path, self.memory_file)]:
+                del self._read_cache[stale]
+        self._read_cache[path] = (key, content)
+        return content
+
     def get_recent_memories(self, days: int = 7) -> str:
         """
         Get memories from the last N days.
@@ -94,29 +195,52 @@ class MemoryStore:
         Returns:
             Combined memory content.
         """
-        from datetime import timedelta
-
-        memories = []
-        today = datetime.now().date()
+        cutoff, newest = _date_window(days)
+
+        # Stream straight into one buffer instead of joining a list of days
+        buf = io.StringIO()
+        first = True
+        for file_path in self.list_memory_files():
+            date_str = file_path.name[:10]
+            if date_str > newest:
+                continue
+            if date_str < cutoff:
+                break
+            content = _read_or_empty(file_path)
+            if not content:
+                continue
+            if not first:
+                buf.write("\n\n---\n\n")
+            buf.write(content)
+            first = False
+
+        return buf.getvalue()
 
-        for i in range(days):
-            date = today - timedelta(days=i)
-            date_str = date.strftime("%Y-%m-%d")
-            file_path = self.memory_dir / f"{date_str}.md"
+    def list_memory_files(self) -> list[Path]:
+        """List all memory files sorted by date (newest first).
 
-            if file_path.exists():
-                content = file_path.read_text(encoding="utf-8")
-                memories.append(content)
+        The listing is cached until the memory directory's mtime changes.
+        """
+        try:
+            mtime = os.stat(self.memory_dir).st_mtime_ns
+        except FileNotFoundError:
+            return []
 
-        return "\n\n---\n\n".join(memories)
+        if self._listing_cache is None or self._listing_cache[0] != mtime:
+            self._listing_cache = (mtime, self._scan_daily_files())
+        return list(self._listing_cache[1])
 
-    def list_memory_files(self) -> list[Path]:
-        """List all memory files sorted by date (newest first)."""
-        if not self.memory_dir.exists():
+    def _scan_daily_files(self) -> list[Path]:
+        """Scan the memory directory once for daily notes, newest first."""
+        try:
+            with os.scandir(self.memory_dir) as it:
+                names = [e.name for e in it if _DAILY_FILE_RE.fullmatch(e.name)]
+        except FileNotFoundError:
             return []
 
-        files = list(self.memory_dir.glob("????-??-??.md"))
-        return sorted(files, reverse=True)
+        # YYYY-MM-DD names sort chronologically as plain strings
+        names.sort(reverse=True)
+        return [self.memory_dir / name for name in names]
 
     def get_memory_context(self, query: str | None = None) -> str:
         """
@@ -142,13 +266,9 @@ class MemoryStore:
 
         # RAG: semantic search over past daily notes
         if query and self._vector:
-            # Refresh today's file in the index before searching
-            today_file = self.get_today_file()
-            if today_file.exists():
-                try:
-                    self._vector.upsert_file(today_file, doc_type="daily")
-                except Exception:
-                    pass
+            # Index pending appends and any outside edits to today's file
+            self.flush_today()
+            self._refresh_index(self.get_today_file())
 
             # Exclude today's chunks (already shown above) via metadata filter
             today_stem = today_date()
@@ -161,19 +281,83 @@ class MemoryStore:
         return "\n\n".join(parts) if parts else ""
 
     def search_memory(self, query: str, n_results: int = 10) -> str:
-        """Search memory semantically. Used by memory_search tool."""
+        """Search memory semantically and by keyword. Used by memory_search tool."""
         if not self._vector:
             return "Semantic search unavailable (chromadb not installed). Use read_file to read memory files directly."
 
+        semantic = self.semantic_search(query, n_results=n_results)
+        keyword = self.keyword_search(query, n_results=n_results)
+        return self.format_search_results(query, semantic, keyword, n_results=n_results)
+
+    def semantic_search(self, query: str, n_results: int = 10) -> list[str]:
+        """Vector search over all indexed memory, refreshing today's notes first."""
+        if not self._vector:
+            return []
+
         # Ensure today is indexed
-        today_file = self.get_today_file()
-        if today_file.exists():
-            try:
-                self._vector.upsert_file(today_file, doc_type="daily")
-            except Exception:
-                pass
+        self.flush_today()
+        self._refresh_index(self.get_today_file())
+        return self._vector.search(query, n_results=n_results)
+
+    def keyword_search(self, query: str, n_results: int = 10) -> list[str]:
+        """
+        Case-insensitive keyword search over MEMORY.md and recent daily notes.
+
+        Scans the last KEYWORD_SEARCH_DAYS days, plus any daily file whose
+        date appears in the query. Paragraphs containing the whole query
+        rank before paragraphs that merely contain every query term.
+
+        Args:
+            query: Search text.
+            n_results: Maximum number of paragraphs to return.
+
+        Returns:
+            Matching paragraphs, best first.
+        """
+        terms = query.lower().split()
+        if not terms:
+            return []
+        phrase = " ".join(terms)
+
+        cutoff, _ = _date_window(self.KEYWORD_SEARCH_DAYS)
+        files = [self.memory_file] + [
+            f for f in self.list_memory_files() if f.name[:10] >= cutoff or f.name[:10] in terms
+        ]
+
+        exact: list[str] = []
+        partial: list[str] = []
+        for file_path in files:
+            for paragraph in PARAGRAPH_RE.split(_read_or_empty(file_path)):
+                paragraph = paragraph.strip()
+                lowered = " ".join(paragraph.lower().split())
+                if phrase in lowered:
+                    exact.append(paragraph)
+                elif all(t in lowered for t in terms):
+                    partial.append(paragraph)
+            if len(exact) >= n_results:
+                break
+
+        return (exact + partial)[:n_results]
+
+    @staticmethod
+    def format_search_results(
+        query: str,
+        semantic: list[str],
+        keyword: list[str],
+        n_results: int = 10,
+    ) -> str:
+        """
+        Merge semantic and keyword hits into the memory_search tool output.
+
+        Keyword hits already covered by a semantic chunk are dropped; the
+        rest follow the semantic results, up to n_results fragments.
+        """
+        results = list(semantic)
+        for paragraph in keyword:
+            if not any(paragraph in chunk for chunk in results):
+                results.append(paragraph)
+        results = results[:n_results]
 
-        results = self._vector.search(query, n_results=n_results)
         if not results:
             return f"No memories found for: {query}"
 
@@ -182,19 +366,31 @@ class MemoryStore:
             lines.append(f"--- Fragment {i} ---\n{chunk}\n")
         return "\n".join(lines)
 
+    def _refresh_index(self, file_path: Path) -> None:
+        """Upsert a daily file unless it is unchanged since it was last indexed."""
+        with self._index_lock:
+            try:
+                st = file_path.stat()
+            except FileNotFoundError:
+                return
+            # Size too, since an append can land within the mtime granularity
+            key = (st.st_mtime_ns, st.st_size)
+            if self._last_indexed.get(file_path) == key:
+                return
+
+            try:
+                self._vector.upsert_file(file_path, doc_type="daily")
+                self._last_indexed[file_path] = key
+            except Exception as e:
+                logger.warning(f"Failed to upsert {file_path.name} to vector store: {e}")
+
     def _reindex_all(self) -> None:
         """Index all existing memory files into the vector store."""
         if not self._vector:
             return
 
-        total = 0
-
-        # Index MEMORY.md
-        if self.memory_file.exists():
-            total += self._vector.upsert_file(self.memory_file, doc_type="long_term")
-
-        # Index all daily files
-        for f in self.list_memory_files():
-            total += self._vector.upsert_file(f, doc_type="daily")
+        daily_files = self.list_memory_files()
+        files = [(self.memory_file, "long_term")] + [(f, "daily") for f in daily_files]
+        total = self._vector.upsert_many(files)
 
-        logger.info(f"Reindexed memory: {total} chunks from {len(self.list_memory_files())} daily files + MEMORY.md")
+        logger.info(f"Reindexed memory: {total} chunks from {len(daily_files)} daily files + MEMORY.md")
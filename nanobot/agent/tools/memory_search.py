@@ -1,5 +1,6 @@
 """Memory search tool: semantic search over agent memory."""
 
+import asyncio
 from typing import Any
 
 from nanobot.agent.tools.base import Tool
@@ -35,4 +36,9 @@ class MemorySearchTool(Tool):
         self._memory = memory
 
     async def execute(self, query: str, count: int = 10, **kwargs: Any) -> str:
-        return self._memory.search_memory(query, n_results=count)
+        # Run the vector and keyword tiers concurrently, off the event loop
+        semantic, keyword = await asyncio.gather(
+            asyncio.to_thread(self._memory.semantic_search, query, count),
+            asyncio.to_thread(self._memory.keyword_search, query, count),
+        )
+        return self._memory.format_search_results(query, semantic, keyword, n_results=count)
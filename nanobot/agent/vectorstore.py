@@ -1,9 +1,38 @@
 """Vector store for semantic memory search using ChromaDB."""
 
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 from loguru import logger
 
+# Paragraph boundaries: two or more consecutive newlines. Shared with the
+# memory keyword search so both tiers see the same paragraphs.
+PARAGRAPH_RE = re.compile(r"\n{2,}")
+
+# NANOBOT_EMBEDDING_DEVICE -> ONNX Runtime execution providers, in priority order
+_PROVIDER_MAP = {
+    "auto": [
+        "CUDAExecutionProvider",
+        "CoreMLExecutionProvider",
+        "DmlExecutionProvider",
+        "CPUExecutionProvider",
+    ],
+    "cuda": ["CUDAExecutionProvider", "CPUExecutionProvider"],
+    "coreml": ["CoreMLExecutionProvider", "CPUExecutionProvider"],
+    "directml": ["DmlExecutionProvider", "CPUExecutionProvider"],
+    "cpu": ["CPUExecutionProvider"],
+}
+
 
 def is_available() -> bool:
     """Check if chromadb is installed."""
@@ -14,10 +43,205 @@ def is_available() -> bool:
         return False
 
 
+@lru_cache(maxsize=1)
+def _get_embedder():
+    """Build the process-wide embedder, preferring accelerated ONNX Runtime providers.
+
+    Uses the same all-MiniLM-L6-v2 model as Chroma's default embedder so
+    existing collections stay compatible; falls back to that default if
+    ONNX Runtime is unusable.
+    """
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+    device = os.environ.get("NANOBOT_EMBEDDING_DEVICE", "auto").lower()
+    wanted = _PROVIDER_MAP.get(device)
+    if wanted is None:
+        logger.warning(f"Unknown NANOBOT_EMBEDDING_DEVICE={device!r}, using auto")
+        wanted = _PROVIDER_MAP["auto"]
+
+    try:
+        import onnxruntime
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+        available = set(onnxruntime.get_available_providers())
+        providers = [p for p in wanted if p in available]
+        if providers:
+            logger.debug(f"Embedding with ONNX Runtime providers: {providers}")
+            return ONNXMiniLM_L6_V2(preferred_providers=providers)
+        logger.warning(f"No ONNX Runtime provider available for device {device!r}")
+    except Exception as e:
+        logger.debug(f"ONNX Runtime embedder unavailable: {e}")
+    return DefaultEmbeddingFunction()
+
+
+@lru_cache(maxsize=2048)
+def _embed_query(query: str) -> tuple[float, ...]:
+    """Embed a query string, memoized so repeated queries skip the model."""
+    return tuple(float(x) for x in _get_embedder()([query])[0])
+
+
+# Stores whose query cache is saved at interpreter exit
+_exit_stores: "weakref.WeakSet[VectorStore]" = weakref.WeakSet()
+
+
+def _save_query_caches_at_exit() -> None:
+    for store in list(_exit_stores):
+        if store._unsaved_misses:
+            store.save_query_cache()
+
+
+class QueryCache:
+    """In-process semantic cache in front of vector search.
+
+    A query whose embedding has cosine similarity >= ``threshold`` with a
+    cached query (searched with the same parameters) reuses that query's
+    results. The least recently used entry is evicted at ``capacity``.
+    """
+
+    def __init__(self, capacity: int = 256, threshold: float = 0.97):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._matrix = None  # (capacity, dim) float32, unit-norm rows; unused rows are zero
+        # slot -> (scope, results, created_at), in least-recently-used-first order
+        self._entries: OrderedDict[int, tuple[str, list[str], float]] = OrderedDict()
+
+    def get(self, embedding, scope: str) -> list[str] | None:
+        """Return cached results for a similar query, or None on a miss."""
+        import numpy as np
+
+        q = self._normalize(embedding)
+        if q is None or self._matrix is None or self._matrix.shape[1] != q.shape[0]:
+            return None
+
+        sims = self._matrix @ q
+        for slot in np.argsort(-sims):
+            if sims[slot] < self.threshold:
+                break
+            entry = self._entries.get(int(slot))
+            if entry is not None and entry[0] == scope:
+                self._entries.move_to_end(int(slot))
+                return entry[1]
+        return None
+
+    def put(
+        self,
+        embedding,
+        scope: str,
+        results: list[str],
+        created_at: float | None = None,
+    ) -> None:
+        """Cache results for a query embedding, evicting the LRU entry if full."""
+        import numpy as np
+
+        q = self._normalize(embedding)
+        if q is None or self.capacity <= 0:
+            return
+
+        if self._matrix is None or self._matrix.shape[1] != q.shape[0]:
+            self._matrix = np.zeros((self.capacity, q.shape[0]), dtype=np.float32)
+            self._entries.clear()
+
+        if len(self._entries) < self.capacity:
+            slot = len(self._entries)
+        else:
+            slot, _ = self._entries.popitem(last=False)
+
+        self._matrix[slot] = q
+        self._entries[slot] = (scope, results, time.time() if created_at is None else created_at)
+
+    def clear(self) -> None:
+        """Drop all entries, e.g. after the collection changed."""
+        self._matrix = None
+        self._entries.clear()
+
+    def save(self, npz_path: Path, jsonl_path: Path, generation: str) -> None:
+        """Persist entries in LRU order for a warm start; skipped if not writable.
+
+        Embeddings go to ``npz_path``; scopes, results and timestamps go to
+        ``jsonl_path``. Both record ``generation`` (the index state the
+        results belong to) and a save id tying the two files together.
+        """
+        import numpy as np
+
+        slots = list(self._entries)
+        if self._matrix is not None and slots:
+            embs = self._matrix[slots]
+        else:
+            embs = np.zeros((0, 0), dtype=np.float32)
+        save_id = f"{time.time_ns()}-{os.getpid()}"
+
+        try:
+            tmp_path = jsonl_path.with_name(jsonl_path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"save_id": save_id, "generation": generation}) + "\n")
+                for slot in slots:
+                    scope, results, created_at = self._entries[slot]
+                    f.write(json.dumps({"scope": scope, "results": results, "ts": created_at}) + "\n")
+            os.replace(tmp_path, jsonl_path)
+
+            tmp_path = npz_path.with_name(npz_path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.savez(f, embs=embs, save_id=np.array(save_id))
+            os.replace(tmp_path, npz_path)
+        except OSError as e:
+            logger.debug(f"Query cache not persisted: {e}")
+
+    def load(self, npz_path: Path, jsonl_path: Path, generation: str) -> int:
+        """Restore entries saved for the same ``generation``; returns how many."""
+        import numpy as np
+
+        try:
+            with np.load(npz_path) as data:
+                embs = data["embs"]
+                save_id = str(data["save_id"])
+            with open(jsonl_path, encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                rows = [json.loads(line) for line in f]
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f"Ignoring unreadable query cache: {e}")
+            return 0
+
+        if (
+            header.get("save_id") != save_id
+            or header.get("generation") != generation
+            or len(rows) != embs.shape[0]
+        ):
+            return 0
+
+        self.clear()
+        # Oldest first, so the most recently used entries survive the cap
+        for emb, row in list(zip(embs, rows))[-self.capacity:]:
+            self.put(emb, row["scope"], row["results"], created_at=row.get("ts"))
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding):
+        import numpy as np
+
+        q = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(q))
+        if norm == 0.0:
+            return None
+        return q / norm
+
+
 class VectorStore:
     """Thin wrapper around ChromaDB for memory search."""
 
     MIN_CHUNK_LENGTH = 50
+    TARGET_CHUNK_CHARS = 384
+    MAX_CHUNK_CHARS = 1024
+    UPSERT_BATCH_SIZE = 512
+    QUERY_CACHE_SIZE = 4096  # ~6MB of float32 at 384 dims
+    QUERY_CACHE_THRESHOLD = 0.97
+    # Save the query cache after this many misses, or on the first miss this
+    # many seconds after the last save; the exit hook is only a final flush.
+    QUERY_CACHE_SAVE_EVERY = 16
+    QUERY_CACHE_SAVE_INTERVAL = 60.0
+    EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+    SQ8_REFINE_FACTOR = 4
 
     def __init__(self, persist_dir: Path):
         import chromadb
@@ -28,6 +252,34 @@ class VectorStore:
             name="memory",
             metadata={"hnsw:space": "cosine"},
         )
+        self._collection = self._wrap_quantized(self._collection)
+        # Documents and queries are embedded here and passed to Chroma as
+        # vectors, so the collection's persisted embedder config is untouched.
+        self._embedding_function = _get_embedder()
+        self._query_cache = QueryCache(self.QUERY_CACHE_SIZE, self.QUERY_CACHE_THRESHOLD)
+        # Searches run on worker threads (memory_search) alongside upserts from
+        # the agent loop; one lock keeps writes, the hash diff and the cache consistent.
+        self._lock = threading.RLock()
+
+        rows = self._collection.get(include=["metadatas"])
+        self._backfill_quantized(rows)
+        # Rows indexed before chunk hashes were stored; the owner should
+        # reindex every file once so their stale ids get pruned.
+        self.needs_reindex = any(not (meta or {}).get("hash") for meta in rows["metadatas"] or [])
+
+        # Query cache persisted next to the DB; only reused while the index
+        # is in the same state it was saved in.
+        self._generation: str | None = self._fingerprint(rows)
+        self._query_cache_paths = (persist_dir / "query_cache.npz", persist_dir / "query_cache.jsonl")
+        restored = self._query_cache.load(*self._query_cache_paths, self._index_generation())
+        if restored:
+            logger.debug(f"Restored {restored} cached queries")
+        self._unsaved_misses = 0
+        self._last_cache_save = time.monotonic()
+        _exit_stores.add(self)
+        atexit.unregister(_save_query_caches_at_exit)
+        atexit.register(_save_query_caches_at_exit)
+
         logger.debug(f"VectorStore ready, {self._collection.count()} chunks in collection")
 
     # ------------------------------------------------------------------
@@ -39,20 +291,74 @@ class VectorStore:
 
         Returns the number of chunks upserted.
         """
-        if not file_path.exists():
-            return 0
+        return self.upsert_many([(file_path, doc_type)])
 
-        text = file_path.read_text(encoding="utf-8")
-        chunks = self._split_paragraphs(text)
-        if not chunks:
-            return 0
+    def upsert_many(self, files: list[tuple[Path, str]]) -> int:
+        """Upsert chunks from several (file_path, doc_type) pairs in batched calls.
+
+        Files are read and split (on a thread pool when there are several),
+        then chunks are accumulated into batches of UPSERT_BATCH_SIZE, so the
+        embedder sees large batches instead of one call per file. Chunks whose
+        content hash is unchanged are skipped, and chunks that vanished from a
+        file are deleted.
+
+        Each chunk's content hash is kept in its metadata, so the collection
+        itself is the only record of what is indexed, even when several
+        processes share it.
+
+        Returns the number of chunks actually upserted.
+        """
+        with self._lock:
+            ids: list[str] = []
+            documents: list[str] = []
+            metadatas: list[dict] = []
+            removed: list[str] = []
+            total = 0
+
+            def flush() -> None:
+                if ids:
+                    self._collection.upsert(
+                        ids=ids,
+                        embeddings=self._embed(documents),
+                        documents=documents,
+                        metadatas=metadatas,
+                    )
+                ids.clear()
+                documents.clear()
+                metadatas.clear()
+
+            all_chunks = self._read_all_chunks(files)
+            stored = self._stored_hashes(
+                [file_path.stem for (file_path, _), chunks in zip(files, all_chunks) if chunks is not None]
+            )
+            for (file_path, doc_type), chunks in zip(files, all_chunks):
+                if chunks is None:
+                    continue
+                source = file_path.stem  # e.g. "2025-06-01" or "MEMORY"
+                hashes = stored.get(source, {})
 
-        source = file_path.stem  # e.g. "2025-06-01" or "MEMORY"
-        ids = [f"{source}::{i}" for i in range(len(chunks))]
-        metadatas = [{"source": source, "type": doc_type} for _ in chunks]
+                current = {f"{source}::{i}" for i in range(len(chunks))}
+                removed.extend(chunk_id for chunk_id in hashes if chunk_id not in current)
 
-        self._collection.upsert(ids=ids, documents=chunks, metadatas=metadatas)
-        return len(chunks)
+                for i, chunk in enumerate(chunks):
+                    chunk_id = f"{source}::{i}"
+                    digest = self._chunk_hash(chunk)
+                    if hashes.get(chunk_id) == digest:
+                        continue
+                    ids.append(chunk_id)
+                    documents.append(chunk)
+                    metadatas.append({"source": source, "type": doc_type, "hash": digest})
+                    total += 1
+                    if len(ids) >= self.UPSERT_BATCH_SIZE:
+                        flush()
+            flush()
+
+            if removed:
+                self._collection.delete(ids=removed)
+
+            if total or removed:
+                self._invalidate()
+            return total
 
     def search(
         self,
@@ -60,25 +366,54 @@ class VectorStore:
         n_results: int = 5,
         where: dict | None = None,
     ) -> list[str]:
-        """Semantic search, returns chunk texts."""
-        kwargs: dict = {"query_texts": [query], "n_results": n_results}
-        if where:
-            kwargs["where"] = where
+        """Semantic search, returns chunk texts.
 
-        try:
-            results = self._collection.query(**kwargs)
-        except Exception as e:
-            logger.warning(f"VectorStore search failed: {e}")
-            return []
+        Results for near-identical earlier queries are served from the
+        in-process query cache.
+        """
+        with self._lock:
+            scope = json.dumps([n_results, where], sort_keys=True)
+            try:
+                embedding = _embed_query(query)
+                cached = self._query_cache.get(embedding, scope)
+                if cached is not None:
+                    return list(cached)
+
+                kwargs: dict = {
+                    "query_embeddings": [list(embedding)],
+                    "n_results": n_results,
+                    "include": ["documents"],
+                }
+                if where:
+                    kwargs["where"] = where
+                results = self._collection.query(**kwargs)
+            except Exception as e:
+                logger.warning(f"VectorStore search failed: {e}")
+                return []
+
+            docs = results.get("documents")
+            found = docs[0] if docs and docs[0] else []
+            self._query_cache.put(embedding, scope, found)
+            self._unsaved_misses += 1
+            if (
+                self._unsaved_misses >= self.QUERY_CACHE_SAVE_EVERY
+                or time.monotonic() - self._last_cache_save >= self.QUERY_CACHE_SAVE_INTERVAL
+            ):
+                self.save_query_cache()
+            return list(found)
 
-        docs = results.get("documents")
-        if docs and docs[0]:
-            return docs[0]
-        return []
+    def save_query_cache(self) -> None:
+        """Write the semantic query cache to disk for the next process."""
+        with self._lock:
+            self._query_cache.save(*self._query_cache_paths, self._index_generation())
+            self._unsaved_misses = 0
+            self._last_cache_save = time.monotonic()
 
     def delete_by_source(self, source_name: str) -> None:
         """Delete all chunks from a given source."""
-        self._collection.delete(where={"source": source_name})
+        with self._lock:
+            self._collection.delete(where={"source": source_name})
+            self._invalidate()
 
     def count(self) -> int:
         """Total number of chunks in the collection."""
@@ -88,8 +423,133 @@ class VectorStore:
     # Internal
     # ------------------------------------------------------------------
 
+    @classmethod
+    def _wrap_quantized(cls, collection):
+        """Wrap the collection with turbochroma SQ8 blobs + ADC re-ranking, if installed.
+
+        Queries over-fetch ``SQ8_REFINE_FACTOR`` times the requested results
+        and re-rank them against the 8-bit vectors on CPU.
+        """
+        try:
+            from turbochroma import QuantizedCollection, SQ8Codec
+        except ImportError:
+            return collection
+
+        codec = SQ8Codec(dimension=cls.EMBEDDING_DIM)
+        logger.debug("turbochroma installed — storing SQ8 vectors for ADC re-ranking")
+        return QuantizedCollection(collection, codec, refine_factor=cls.SQ8_REFINE_FACTOR)
+
+    def _backfill_quantized(self, rows: dict) -> None:
+        """Add SQ8 blobs to rows indexed before turbochroma was installed.
+
+        Unchanged chunks are never re-upserted, so without this an existing
+        index would keep ranking on Chroma's distances alone.
+        """
+        blob_key = getattr(self._collection, "blob_key", None)
+        if blob_key is None or all(blob_key in (meta or {}) for meta in rows["metadatas"] or []):
+            return
+        fitted = self._collection.fit_existing()
+        logger.info(f"Backfilled SQ8 vectors for {fitted} existing chunks")
+
+    def _embed(self, documents: list[str]) -> list:
+        """Embed a batch of documents."""
+        return list(self._embedding_function(documents))
+
+    @classmethod
+    def _read_all_chunks(cls, files: list[tuple[Path, str]]) -> list[list[str] | None]:
+        """Read and split every file, in order; several files go through a thread pool."""
+        paths = [file_path for file_path, _ in files]
+        if len(paths) <= 1:
+            # Not worth a pool for the single-file upserts on every write
+            return [cls._read_chunks(p) for p in paths]
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1, len(paths))) as pool:
+            return list(pool.map(cls._read_chunks, paths))
+
+    @classmethod
+    def _read_chunks(cls, file_path: Path) -> list[str] | None:
+        """Read and split a file, or None if it does not exist."""
+        try:
+            return cls._split_paragraphs(file_path.read_bytes())
+        except FileNotFoundError:
+            return None
+
+    def _stored_hashes(self, sources: list[str]) -> dict[str, dict[str, str | None]]:
+        """Map each source to its stored chunk ids and their content hashes.
+
+        Chunks indexed before hashes were recorded map to None, so they are
+        re-upserted (or deleted, if the file no longer has them).
+        """
+        if not sources:
+            return {}
+        where = {"source": sources[0]} if len(sources) == 1 else {"source": {"$in": sources}}
+        rows = self._collection.get(where=where, include=["metadatas"])
+        stored: dict[str, dict[str, str | None]] = {}
+        for chunk_id, meta in zip(rows["ids"], rows["metadatas"] or []):
+            meta = meta or {}
+            stored.setdefault(meta.get("source"), {})[chunk_id] = meta.get("hash")
+        return stored
+
+    def _invalidate(self) -> None:
+        """Forget cached results and the index fingerprint after a write."""
+        self._query_cache.clear()
+        self._generation = None
+
+    def _index_generation(self) -> str:
+        """Fingerprint of the indexed content, recomputed after writes."""
+        if self._generation is None:
+            self._generation = self._fingerprint(self._collection.get(include=["metadatas"]))
+        return self._generation
+
+    def _fingerprint(self, rows: dict) -> str:
+        """Hash the (id, chunk hash) pairs of a collection.get() result."""
+        hashes = sorted(
+            (chunk_id, (meta or {}).get("hash") or "")
+            for chunk_id, meta in zip(rows["ids"], rows["metadatas"] or [])
+        )
+        state = json.dumps([type(self._collection).__name__, hashes])
+        return hashlib.blake2b(state.encode("utf-8"), digest_size=16).hexdigest()
+
     @staticmethod
-    def _split_paragraphs(text: str) -> list[str]:
-        """Split text by double newline, filter short chunks."""
-        paragraphs = text.split("\n\n")
-        return [p.strip() for p in paragraphs if len(p.strip()) >= VectorStore.MIN_CHUNK_LENGTH]
+    def _chunk_hash(chunk: str) -> str:
+        """Short content hash used to detect unchanged chunks."""
+        return hashlib.blake2b(chunk.encode("utf-8"), digest_size=8).hexdigest()
+
+    @staticmethod
+    def _split_paragraphs(
+        text: str | bytes,
+        target_chars: int = TARGET_CHUNK_CHARS,
+        max_chars: int = MAX_CHUNK_CHARS,
+    ) -> list[str]:
+        """Split text on blank lines and pack paragraphs into chunks.
+
+        Consecutive paragraphs are joined until a chunk reaches
+        ``target_chars``, or the next one would push it past ``max_chars``.
+        Chunks shorter than MIN_CHUNK_LENGTH are dropped. Raw UTF-8 bytes
+        are decoded first, so they split exactly like the equivalent str.
+        """
+        if isinstance(text, bytes):
+            text = text.decode("utf-8")
+        paragraphs = (p.strip() for p in PARAGRAPH_RE.split(text))
+
+        out: list[str] = []
+        buf: list[str] = []
+        size = 0
+
+        def flush() -> None:
+            nonlocal size
+            if size >= VectorStore.MIN_CHUNK_LENGTH:
+                out.append("\n\n".join(buf))
+            buf.clear()
+            size = 0
+
+        for p in paragraphs:
+            if not p:
+                continue
+            if buf and size + 2 + len(p) > max_chars:
+                flush()
+            size += len(p) + (2 if buf else 0)
+            buf.append(p)
+            if size >= target_chars:
+                flush()
+        flush()
+        return out
@@ -1,7 +1,7 @@
 """Utility functions for nanobot."""
 
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime
 
 
 def ensure_dir(path: Path) -> Path:
@@ -51,7 +51,7 @@ def get_skills_path(workspace: Path | None = None) -> Path:
 
 def today_date() -> str:
     """Get today's date in YYYY-MM-DD format."""
-    return datetime.now().strftime("%Y-%m-%d")
+    return date.today().isoformat()
 
 
 def timestamp() -> str:
@@ -0,0 +1,449 @@
+import gc
+import sys
+import threading
+import types
+import weakref
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from loguru import logger
+
+from nanobot.agent import vectorstore
+from nanobot.agent.memory import MemoryStore
+from nanobot.agent.tools.memory_search import MemorySearchTool
+from nanobot.agent.vectorstore import QueryCache, VectorStore
+from nanobot.utils.helpers import today_date
+
+
+def _stub_embed(texts: list[str]) -> list[list[float]]:
+    """Deterministic bag-of-characters embedding, so tests skip the real model."""
+    vectors = []
+    for text in texts:
+        vec = [0.0] * VectorStore.EMBEDDING_DIM
+        for ch in text:
+            vec[ord(ch) % VectorStore.EMBEDDING_DIM] += 1.0
+        vectors.append(vec)
+    return vectors
+
+
+@pytest.fixture
+def stub_embedder(monkeypatch: pytest.MonkeyPatch) -> None:
+    pytest.importorskip("chromadb")
+    monkeypatch.setattr(vectorstore, "_get_embedder", lambda: _stub_embed)
+    monkeypatch.setattr(vectorstore, "_embed_query", lambda query: tuple(_stub_embed([query])[0]))
+
+
+def test_get_embedder_picks_available_providers_for_device(monkeypatch: pytest.MonkeyPatch) -> None:
+    onnxruntime = pytest.importorskip("onnxruntime")
+    embedding_functions = pytest.importorskip("chromadb.utils.embedding_functions")
+
+    class FakeONNX:
+        def __init__(self, preferred_providers: list[str]) -> None:
+            self.providers = preferred_providers
+
+    class FakeDefault:
+        providers = None
+
+    monkeypatch.setattr(embedding_functions, "ONNXMiniLM_L6_V2", FakeONNX)
+    monkeypatch.setattr(embedding_functions, "DefaultEmbeddingFunction", FakeDefault)
+    warnings: list[str] = []
+    handler = logger.add(warnings.append, level="WARNING", format="{message}")
+
+    def embedder(device: str, available: list[str]):
+        monkeypatch.setenv("NANOBOT_EMBEDDING_DEVICE", device)
+        monkeypatch.setattr(onnxruntime, "get_available_providers", lambda: available)
+        vectorstore._get_embedder.cache_clear()
+        return vectorstore._get_embedder()
+
+    try:
+        cuda_box = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+        assert embedder("CUDA", cuda_box).providers == cuda_box
+        assert embedder("auto", ["CPUExecutionProvider", "AzureExecutionProvider"]).providers == [
+            "CPUExecutionProvider"
+        ]
+        assert embedder("cpu", cuda_box).providers == ["CPUExecutionProvider"]
+        assert not warnings
+
+        assert embedder("tpu", cuda_box).providers == cuda_box
+        assert "Unknown NANOBOT_EMBEDDING_DEVICE='tpu'" in warnings.pop()
+
+        assert isinstance(embedder("directml", []), FakeDefault)
+        assert "No ONNX Runtime provider available for device 'directml'" in warnings.pop()
+
+        def broken_onnx(preferred_providers: list[str]) -> None:
+            raise RuntimeError("model download failed")
+
+        monkeypatch.setattr(embedding_functions, "ONNXMiniLM_L6_V2", broken_onnx)
+        assert isinstance(embedder("cpu", cuda_box), FakeDefault)
+    finally:
+        logger.remove(handler)
+        vectorstore._get_embedder.cache_clear()
+
+
+def test_append_today_adds_header_and_separates_paragraphs(tmp_path: Path) -> None:
+    store = MemoryStore(tmp_path)
+    store.append_today("first note")
+    store.append_today("second note")
+
+    assert store.read_today() == f"# {today_date()}\n\nfirst note\n\nsecond note"
+
+
+def test_get_recent_memories_window_and_order(tmp_path: Path) -> None:
+    store = MemoryStore(tmp_path)
+    today = datetime.now().date()
+    for offset in (0, 2, 5):
+        day = (today - timedelta(days=offset)).isoformat()
+        (store.memory_dir / f"{day}.md").write_text(f"day -{offset}", encoding="utf-8")
+    (store.memory_dir / "notes.md").write_text("not a daily file", encoding="utf-8")
+
+    assert store.get_recent_memories(days=3) == "day -0\n\n---\n\nday -2"
+    assert [p.name for p in store.list_memory_files()] == [
+        f"{(today - timedelta(days=o)).isoformat()}.md" for o in (0, 2, 5)
+    ]
+
+
+def test_list_memory_files_sees_new_files(tmp_path: Path) -> None:
+    store = MemoryStore(tmp_path)
+    assert store.list_memory_files() == []
+
+    store.append_today("note")
+    assert store.list_memory_files() == [store.get_today_file()]
+
+
+def test_split_paragraphs_packs_short_paragraphs() -> None:
+    text = "# title\n\n" + "a" * 40 + "\n\n\n\n  " + "b" * 40 + "  \n\n\nshort"
+
+    packed = "# title\n\n" + "a" * 40 + "\n\n" + "b" * 40 + "\n\nshort"
+    assert VectorStore._split_paragraphs(text) == [packed]
+    assert VectorStore._split_paragraphs(text.encode("utf-8")) == VectorStore._split_paragraphs(text)
+
+    nbsp = "\u00a0" + "c" * 60 + "\u00a0"  # str.strip() removes NBSP, bytes.strip() would not
+    assert VectorStore._split_paragraphs(nbsp.encode("utf-8")) == ["c" * 60]
+
+
+def test_split_paragraphs_respects_target_and_max() -> None:
+    text = "\n\n".join(["a" * 60, "b" * 60, "c" * 200, "d" * 10])
+
+    assert VectorStore._split_paragraphs(text, target_chars=100, max_chars=1000) == [
+        "a" * 60 + "\n\n" + "b" * 60,
+        "c" * 200,
+    ]
+    assert VectorStore._split_paragraphs(text, target_chars=1000, max_chars=150) == [
+        "a" * 60 + "\n\n" + "b" * 60,
+        "c" * 200,
+    ]
+
+
+def test_query_cache_hits_similar_queries_and_evicts_lru() -> None:
+    pytest.importorskip("numpy")
+    cache = QueryCache(capacity=2, threshold=0.97)
+
+    cache.put([1.0, 0.0], "scope", ["a"])
+    assert cache.get([1.0, 0.01], "scope") == ["a"]
+    assert cache.get([1.0, 0.01], "other") is None
+    assert cache.get([0.0, 1.0], "scope") is None
+
+    cache.put([0.0, 1.0], "scope", ["b"])
+    cache.get([1.0, 0.0], "scope")  # touch "a" so "b" is the LRU entry
+    cache.put([0.7, 0.7], "scope", ["c"])
+    assert cache.get([0.0, 1.0], "scope") is None
+    assert cache.get([1.0, 0.0], "scope") == ["a"]
+
+    cache.clear()
+    assert cache.get([1.0, 0.0], "scope") is None
+
+
+def test_keyword_search_ranks_phrase_matches_first(tmp_path: Path) -> None:
+    store = MemoryStore(tmp_path)
+    store.memory_file.write_text("Coffee is fine, but the user prefers green tea.", encoding="utf-8")
+    store.append_today("Bought green tea today.")
+    store.append_today("Nothing relevant here.")
+
+    assert store.keyword_search("Green  TEA") == [
+        "Coffee is fine, but the user prefers green tea.",
+        "Bought green tea today.",
+    ]
+    assert store.keyword_search("tea coffee") == ["Coffee is fine, but the user prefers green tea."]
+    assert store.keyword_search("") == []
+
+
+def test_format_search_results_dedupes_keyword_hits() -> None:
+    out = MemoryStore.format_search_results(
+        "tea",
+        semantic=["likes tea\n\nand cake"],
+        keyword=["likes tea", "tea at noon"],
+        n_results=10,
+    )
+    assert out.count("--- Fragment") == 2
+    assert "tea at noon" in out
+
+    assert MemoryStore.format_search_results("tea", [], []) == "No memories found for: tea"
+
+
+async def test_memory_search_tool_merges_tiers(tmp_path: Path) -> None:
+    store = MemoryStore(tmp_path)
+    store.append_today("Bought green tea today.")
+
+    result = await MemorySearchTool(memory=store).execute(query="green tea", count=5)
+    assert "Found 1 relevant memory fragments" in result
+    assert "Bought green tea today." in result
+
+
+def test_read_long_term_tracks_file_changes(tmp_path: Path) -> None:
+    store = MemoryStore(tmp_path)
+    assert store.read_long_term() == ""
+
+    store.write_long_term("short")
+    assert store.read_long_term() == "short"
+
+    big = "é" * 40_000  # > 64KB encoded, read through mmap
+    store.write_long_term(big)
+    assert store.read_long_term() == big
+
+    store.memory_file.unlink()
+    assert store.read_long_term() == ""
+
+
+def test_read_cache_keeps_only_current_day(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    store = MemoryStore(tmp_path)
+    store.write_long_term("long term")
+    store.read_long_term()
+    for day in ("2025-06-01", "2025-06-02"):
+        (store.memory_dir / f"{day}.md").write_text(day, encoding="utf-8")
+        monkeypatch.setattr(store, "get_today_file", lambda day=day: store.memory_dir / f"{day}.md")
+        assert store.read_today() == day
+
+    assert set(store._read_cache) == {store.memory_file, store.memory_dir / "2025-06-02.md"}
+
+
+def test_query_cache_persists_per_generation(tmp_path: Path) -> None:
+    pytest.importorskip("numpy")
+    paths = (tmp_path / "query_cache.npz", tmp_path / "query_cache.jsonl")
+    cache = QueryCache(capacity=4)
+    cache.put([1.0, 0.0], "scope", ["a"])
+    cache.put([0.0, 1.0], "scope", ["b"])
+    cache.save(*paths, generation="gen-1")
+
+    warm = QueryCache(capacity=4)
+    assert warm.load(*paths, generation="gen-1") == 2
+    assert warm.get([1.0, 0.0], "scope") == ["a"]
+    assert warm.get([0.0, 1.0], "scope") == ["b"]
+
+    stale = QueryCache(capacity=4)
+    assert stale.load(*paths, generation="gen-2") == 0
+    assert stale.get([1.0, 0.0], "scope") is None
+
+
+def test_vector_store_skips_unchanged_and_prunes_vanished_chunks(tmp_path: Path, stub_embedder) -> None:
+    note = tmp_path / "2025-06-01.md"
+    note.write_text("\n\n".join(p * 400 for p in "abc"), encoding="utf-8")
+    store = VectorStore(tmp_path / "chroma")
+    assert store.upsert_file(note) == 3
+    assert store.upsert_file(note) == 0
+
+    note.write_text("\n\n".join(p * 400 for p in "aB"), encoding="utf-8")
+    assert store.upsert_file(note) == 1
+    assert sorted(store._collection.get()["ids"]) == ["2025-06-01::0", "2025-06-01::1"]
+
+    reopened = VectorStore(tmp_path / "chroma")
+    assert reopened.upsert_file(note) == 0
+
+
+def test_vector_stores_sharing_a_directory_prune_each_others_chunks(
+    tmp_path: Path, stub_embedder
+) -> None:
+    first, second = tmp_path / "2025-06-01.md", tmp_path / "2025-06-02.md"
+    first.write_text("\n\n".join(p * 400 for p in "abc"), encoding="utf-8")
+    second.write_text("d" * 400, encoding="utf-8")
+    gateway, cli = VectorStore(tmp_path / "chroma"), VectorStore(tmp_path / "chroma")
+    gateway.upsert_file(first)
+    cli.upsert_file(second)
+
+    first.write_text("a" * 400, encoding="utf-8")
+    store = VectorStore(tmp_path / "chroma")
+    assert store.upsert_file(first) == 0
+    assert store.count() == 2
+    assert "c" * 400 not in store.search("c" * 400, n_results=2)
+
+
+def test_vector_store_migrates_chunks_without_hashes(tmp_path: Path, stub_embedder) -> None:
+    store = VectorStore(tmp_path / "chroma")
+    legacy = ["a" * 400, "b" * 400, "c" * 400]  # one chunk per paragraph, no hash
+    store._collection.upsert(
+        ids=[f"2025-06-01::{i}" for i in range(3)],
+        embeddings=_stub_embed(legacy),
+        documents=legacy,
+        metadatas=[{"source": "2025-06-01", "type": "daily"}] * 3,
+    )
+
+    (tmp_path / "memory").mkdir()
+    (tmp_path / "memory" / "2025-06-01.md").write_text("a" * 400, encoding="utf-8")
+    memory = MemoryStore(tmp_path, chroma_dir=tmp_path / "chroma")
+    assert memory._vector._collection.get()["ids"] == ["2025-06-01::0"]
+    assert not VectorStore(tmp_path / "chroma").needs_reindex
+
+
+def test_vector_store_saves_query_cache_while_running(
+    tmp_path: Path, stub_embedder, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(VectorStore, "QUERY_CACHE_SAVE_EVERY", 2)
+    note = tmp_path / "2025-06-01.md"
+    note.write_text("a" * 400, encoding="utf-8")
+    store = VectorStore(tmp_path / "chroma")
+    store.upsert_file(note)
+
+    store.search("first")
+    assert not (tmp_path / "chroma" / "query_cache.npz").exists()
+    store.search("second")
+    # No exit hook ran, as after a SIGKILL or docker stop
+    assert len(VectorStore(tmp_path / "chroma")._query_cache._entries) == 2
+
+
+def test_vector_store_search_does_not_cache_results_across_a_write(
+    tmp_path: Path, stub_embedder, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    note = tmp_path / "2025-06-01.md"
+    note.write_text("a" * 400, encoding="utf-8")
+    store = VectorStore(tmp_path / "chroma")
+    store.upsert_file(note)
+
+    writer = threading.Thread(target=store.upsert_file, args=(note,))
+    query = store._collection.query
+
+    def query_then_write(**kwargs):
+        results = query(**kwargs)
+        note.write_text("b" * 400, encoding="utf-8")
+        writer.start()
+        writer.join(timeout=0.2)  # blocked until the search releases the store
+        return results
+
+    monkeypatch.setattr(store._collection, "query", query_then_write)
+    assert store.search("b" * 400, n_results=1) == ["a" * 400]
+    writer.join()
+    monkeypatch.setattr(store._collection, "query", query)
+    assert store.search("b" * 400, n_results=1) == ["b" * 400]
+
+
+def test_append_today_defers_indexing_until_flush(tmp_path: Path, stub_embedder) -> None:
+    store = MemoryStore(tmp_path, chroma_dir=tmp_path / "chroma")
+    store.append_today("a" * 400)
+    store.append_today("b" * 400)
+    assert store._vector.count() == 0
+
+    store.flush_today()
+    assert store._vector.count() == 2
+
+    store.append_today("c" * 400)
+    assert store._vector.count() == 2
+    store.get_memory_context("c")
+    assert store._vector.count() == 3
+
+
+def _install_fake_turbochroma(monkeypatch: pytest.MonkeyPatch) -> types.ModuleType:
+    """Install a recording stand-in for turbochroma that delegates to the real collection."""
+    calls: list[tuple] = []
+
+    class SQ8Codec:
+        def __init__(self, dimension: int) -> None:
+            calls.append(("codec", dimension))
+
+    class QuantizedCollection:
+        blob_key = "tc_blob"
+
+        def __init__(self, collection, codec, refine_factor: int) -> None:
+            calls.append(("wrap", type(codec).__name__, refine_factor))
+            self._inner = collection
+
+        def upsert(self, **kwargs):
+            calls.append(("upsert", sorted(kwargs), None))
+            kwargs["metadatas"] = [{**meta, self.blob_key: "blob"} for meta in kwargs["metadatas"]]
+            return self._inner.upsert(**kwargs)
+
+        def fit_existing(self) -> int:
+            calls.append(("fit_existing",))
+            rows = self._inner.get(include=["metadatas"])
+            metadatas = [{**meta, self.blob_key: "blob"} for meta in rows["metadatas"]]
+            self._inner.update(ids=rows["ids"], metadatas=metadatas)
+            return len(rows["ids"])
+
+        def __getattr__(self, name: str):
+            def call(**kwargs):
+                calls.append((name, sorted(kwargs), kwargs.get("include")))
+                return getattr(self._inner, name)(**kwargs)
+            return call
+
+    turbochroma = types.ModuleType("turbochroma")
+    turbochroma.SQ8Codec = SQ8Codec
+    turbochroma.QuantizedCollection = QuantizedCollection
+    turbochroma.calls = calls
+    monkeypatch.setitem(sys.modules, "turbochroma", turbochroma)
+    return turbochroma
+
+
+@pytest.fixture
+def fake_turbochroma(monkeypatch: pytest.MonkeyPatch) -> types.ModuleType:
+    return _install_fake_turbochroma(monkeypatch)
+
+
+def test_memory_store_indexes_appends_left_pending_by_a_killed_process(
+    tmp_path: Path, stub_embedder
+) -> None:
+    store = MemoryStore(tmp_path, chroma_dir=tmp_path / "chroma")
+    day = store.memory_dir / "2025-06-01.md"
+    day.write_text("a" * 400, encoding="utf-8")
+    store._refresh_index(day)
+    with open(day, "a", encoding="utf-8") as f:
+        f.write("\n\n" + "b" * 400)  # appended, but the process died before flushing
+
+    restarted = MemoryStore(tmp_path, chroma_dir=tmp_path / "chroma")
+    assert restarted._vector.count() == 2
+
+
+def test_vector_store_uses_turbochroma_when_installed(
+    tmp_path: Path, stub_embedder, fake_turbochroma: types.ModuleType
+) -> None:
+    calls = fake_turbochroma.calls
+    note = tmp_path / "2025-06-01.md"
+    note.write_text("\n\n".join(p * 400 for p in "ab"), encoding="utf-8")
+    store = VectorStore(tmp_path / "chroma")
+    assert isinstance(store._collection, fake_turbochroma.QuantizedCollection)
+    assert calls[:2] == [("codec", 384), ("wrap", "SQ8Codec", 4)]
+
+    assert store.upsert_file(note) == 2
+    assert store.search("a" * 400, n_results=1) == ["a" * 400]
+    note.write_text("a" * 400, encoding="utf-8")
+    assert store.upsert_file(note) == 0
+    store.delete_by_source("2025-06-01")
+    assert store.count() == 0
+    assert ("query", ["include", "n_results", "query_embeddings"], ["documents"]) in calls
+    assert ("delete", ["ids"], None) in calls
+    assert ("delete", ["where"], None) in calls
+    assert ("count", [], None) in calls
+    assert ("fit_existing",) not in calls
+
+
+def test_vector_store_backfills_blobs_when_turbochroma_is_added(
+    tmp_path: Path, stub_embedder, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    note = tmp_path / "2025-06-01.md"
+    note.write_text("\n\n".join(p * 400 for p in "ab"), encoding="utf-8")
+    monkeypatch.setitem(sys.modules, "turbochroma", None)  # not installed yet
+    assert VectorStore(tmp_path / "chroma").upsert_file(note) == 2
+
+    turbochroma = _install_fake_turbochroma(monkeypatch)
+    store = VectorStore(tmp_path / "chroma")
+    assert turbochroma.calls.count(("fit_existing",)) == 1
+    assert all("tc_blob" in meta for meta in store._collection.get(include=["metadatas"])["metadatas"])
+    assert store.upsert_file(note) == 0
+
+    VectorStore(tmp_path / "chroma")
+    assert turbochroma.calls.count(("fit_existing",)) == 1
+
+
+def test_stores_are_not_kept_alive_by_exit_hooks(tmp_path: Path, stub_embedder) -> None:
+    store = MemoryStore(tmp_path, chroma_dir=tmp_path / "chroma")
+    refs = [weakref.ref(store), weakref.ref(store._vector)]
+    del store
+    gc.collect()
+    assert [ref() for ref in refs] == [None, None]